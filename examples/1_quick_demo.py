@@ -1,6 +1,7 @@
 import rebound
 from reboundp import ReboundParallel
 import numpy as np
+import tempfile
 
 @ReboundParallel
 def setup_sim(ecc):
@@ -15,10 +16,14 @@ def setup_sim(ecc):
 
 # set up sims to be run in parallel
 ecc_arr = np.linspace(0, 0.999, 200)
-# run, use all available cores
-results = setup_sim.run(jobs=ecc_arr, cores=None, progressbar=True)
-# run, use 1 core
-results = setup_sim.run(jobs=ecc_arr, cores=1, progressbar=True)
+# cache results in a temporary directory, removed at the end of the demo
+with tempfile.TemporaryDirectory() as cache_dir:
+    # run, use all available cores
+    results = setup_sim.run(jobs=ecc_arr, cores=None, progressbar=True, 
+                            cache=cache_dir)
+    # run again, use 1 core: every job is served from the cache instead of integrated
+    results = setup_sim.run(jobs=ecc_arr, cores=1, progressbar=True, 
+                            cache=cache_dir)
 
 for result in results:
     sim, ecc, xyz = result
@@ -2,15 +2,17 @@
 # last modified: December 2023
 
 # Python standard library
-import time, os, warnings, math, inspect, datetime
+import time, os, sys, warnings, inspect, datetime, weakref, numbers, threading, array, itertools, pickle
 from typing import List
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Third-party libraries
-from joblib import Parallel, delayed
-import joblib.parallel
+from joblib import Parallel
+import joblib, joblib.parallel
+from joblib.externals.loky import reusable_executor as loky_reusable_executor
+from joblib.externals.loky import ProcessPoolExecutor as LokyProcessPoolExecutor
 
 # Check which extra features are available
-global FEATURES
 FEATURES = []
 
 try:
@@ -35,28 +37,161 @@ except ImportError:
 from . import port_utils
 from . import utils
 
+SCHEDULING = (None, "static", "dynamic", "guided", "profile")
+
+RESULT_FORMATS = ("aos", "soa")
+
 REB_STATUS = {-3: "paused", -2: "laststep", -1: "running", 0: "finished",
               1: "generic_error", 2: "no_particles", 3: "encounter",
               4: "escape", 5: "user", 6: "sigint", 7: "collision",}
 
+# timeout (in seconds) for requests sent to REBOUND servers
+if "port" in FEATURES:
+    HTTP_TIMEOUT = urllib3.Timeout(connect=0.1, read=0.5)
+
+# progress bars for every 2% of progress
+PROGRESS_BARS = [f"{'■'*i:<50}" for i in range(51)]
+
+# minimum time between two progress bar updates (in seconds)
+PROGRESS_INTERVAL = 0.1
+
 def print_progress(n_completed_tasks:int, joblib_n_jobs:int, joblib_t0:float):
     progress = (n_completed_tasks+1) / joblib_n_jobs
-    time_elapsed = utils.time_format(time.time() - joblib_t0)
-    output = f"\rProgress: [{'■'*int(progress * 50):<50}] {(progress*100):.1f}% [{n_completed_tasks+1}/{joblib_n_jobs} Tasks] [{time_elapsed}]"
-    print(output, end="", flush=True)
+    elapsed = time.time() - joblib_t0
+    time_elapsed = utils.time_format(elapsed)
+    sys.stdout.write(f"\rProgress: [{PROGRESS_BARS[int(progress * 50)]}] {(progress*100):.1f}% [{n_completed_tasks+1}/{joblib_n_jobs} Tasks] [{time_elapsed}]")
 
     if n_completed_tasks+1 >= joblib_n_jobs:
         time_started = datetime.datetime.fromtimestamp(joblib_t0).strftime("on %Y-%m-%d at %H:%M:%S")
-        print(f"\nFinished running {joblib_n_jobs} tasks. Started {time_started}. Walltime: {utils.time_format(time.time() - joblib_t0)}. \n")
+        sys.stdout.write(f"\nFinished running {joblib_n_jobs} tasks. Started {time_started}. Walltime: {time_elapsed}. \n\n")
+    sys.stdout.flush()
+
+def run_batch(simfunc:callable, batch:List[tuple])->List:
+    """ Run `simfunc` serially over a batch of jobs inside one worker.
+
+        Parameters
+        ----------
+        simfunc : callable
+            Function to run
+        batch : list of tuple
+            Arguments passed to `simfunc` for each job in the batch
+
+        Returns
+        -------
+        results : list
+            List of results, one per job in the batch
+    """
+    return [simfunc(*args) for args in batch]
+
+def warmup_worker():
+    """ Import `rebound` and create a `rebound.Simulation` in a worker process,
+        so that the first job run by the worker does not pay for loading `REBOUND`.
+    """
+    try:
+        import rebound
+    except ImportError:
+        return
+    rebound.Simulation()
+
+# (executor id, number of workers) of the last loky executor warmed up by warmup_loky_workers
+_loky_warm_key = None
+
+def loky_executor_key():
+    """ Identify joblib's reusable loky executor by its id and its number of workers.
+
+        Returns
+        -------
+        key : tuple or None
+            `(executor_id, max_workers)`, or `None` if no executor was started yet
+    """
+    executor = getattr(loky_reusable_executor, "_executor", None)
+    if executor is None:
+        return None
+    return (getattr(executor, "executor_id", id(executor)), 
+            getattr(executor, "_max_workers", None))
+
+def warmup_loky_workers(parallel:Parallel, cores:int)->bool:
+    """ Load `REBOUND` in every worker of joblib's reusable loky executor (see `warmup_worker`).
+        Skipped if the executor was already warmed up with `cores` workers, 
+        since joblib reuses it (and its workers) from one run to the next.
+
+        Parameters
+        ----------
+        parallel : joblib.Parallel
+            Open `joblib.Parallel` object (`with Parallel(...) as parallel`) that will run the jobs,
+            so that the workers warmed up are the ones its options (e.g. `max_nbytes`) ask for
+        cores : int
+            Number of workers
+
+        Returns
+        -------
+        warmed_up : bool
+            Whether the workers were warmed up
+    """
+    global _loky_warm_key
+    key = loky_executor_key()
+    if key is not None and key == _loky_warm_key and key[1] == cores:
+        return False
+
+    parallel((warmup_worker, (), {}) for _ in range(cores))
+    _loky_warm_key = loky_executor_key()
+    return True
+
+def validated_property(name:str)->property:
+    """ Property for a parameter checked by `ReboundParallel.validate_init`, stored as `_<name>`.
+        Setting it marks the object to be validated again before the next run.
+
+        Parameters
+        ----------
+        name : str
+            Name of the parameter
+
+        Returns
+        -------
+        prop : property
+            Property getting and setting the parameter
+    """
+    attr = "_" + name
+
+    def getter(self):
+        return getattr(self, attr)
+
+    def setter(self, value):
+        setattr(self, attr, value)
+        self._validated = False
+
+    return property(getter, setter)
 
 class TimedBatchCompletionCallBack(joblib.parallel.BatchCompletionCallBack):
     """ Custom callback for `joblib.parallel.Parallel` that prints progress to `stdout`."""
+
+    def __init__(self, dispatch_timestamp, batch_size, parallel):
+        super().__init__(dispatch_timestamp, batch_size, parallel)
+        # index of the first task of this batch, in the order joblib dispatched them
+        self.first_task = parallel.n_dispatched_tasks - batch_size
      
     def __call__(self, *args, **kwargs):
-        if self.parallel.progressbar:
-            print_progress(self.parallel.n_completed_tasks,
-                           self.parallel.joblib_n_jobs, 
-                           self.parallel.joblib_t0)
+        if getattr(self.parallel, "progressbar", False):
+            # count jobs, not tasks: a task may run a batch of jobs (see `run_batch`)
+            task_ends = self.parallel.joblib_task_ends
+            if task_ends is None:
+                njobs = self.batch_size
+            else:
+                njobs = (task_ends[self.first_task + self.batch_size] - 
+                         task_ends[self.first_task])
+            with self.parallel.joblib_lock:
+                self.parallel.joblib_completed_jobs += njobs
+                n_completed_tasks = self.parallel.joblib_completed_jobs - 1
+            now = time.monotonic()
+
+            # only update every 16 tasks or PROGRESS_INTERVAL seconds, and at the end
+            if (n_completed_tasks % 16 == 0 or 
+                n_completed_tasks+1 >= self.parallel.joblib_n_jobs or
+                now - self.parallel.joblib_last_print > PROGRESS_INTERVAL):
+                self.parallel.joblib_last_print = now
+                print_progress(n_completed_tasks,
+                               self.parallel.joblib_n_jobs, 
+                               self.parallel.joblib_t0)
 
         return super().__call__(*args, **kwargs)
 
@@ -65,9 +200,18 @@ class ReboundParallel():
         Can be used as decorator or as class to construct objects.
         Uses `joblib.Parallel` in the backend to run simulations in parallel.
     """
+    # parameters checked by validate_init, validated again before a run if they change
+    port0 = validated_property("port0")
+    cores = validated_property("cores")
+    port_buffer = validated_property("port_buffer")
+    progressbar = validated_property("progressbar")
+    backend = validated_property("backend")
+    warmup = validated_property("warmup")
+
     def __init__(self, simfunc:callable, 
                  cores:int=None, progressbar:bool=False, 
-                 port_buffer:int=10, port0:int=None):
+                 port_buffer:int=10, port0:int=None, backend:str=None,
+                 warmup:bool=True):
         """ Initialize `REBOUNDParallel` object.
 
             Parameters
@@ -86,7 +230,8 @@ class ReboundParallel():
 
             cores : int, optional
                 Number of cores to use. Must be a positive, non-zero integer. 
-                Default is `None`, which will use all but one core.
+                Default is `None`, which will use all but one of the cores this process may run on
+                (at least one).
             progressbar : bool, optional
                 Whether to print a progress bar to stdout. Default is `False`.
             port_buffer : int, optional
@@ -96,9 +241,31 @@ class ReboundParallel():
             port0 : int, optional
                 First port to use. Must be a positive, non-zero integer, between `1024` and `65535`.
                 Default is `None`, which will automatically determine and use first available port..
+            backend : str, optional
+                `joblib` backend used to run `simfunc` in parallel (e.g. `"threading"` or `"loky"`).
+                Default is `None`, which uses `"threading"` if `simfunc` does not take `port`
+                and `"loky"` otherwise.\n
+                `rebound.Simulation.integrate` runs in REBOUND's C library and releases the GIL,
+                so threads integrate in parallel without pickling simulations between processes.
+                Use `"loky"` if `simfunc` spends most of its time in Python code.
+                Use `"processpool"` to submit jobs directly to a `loky` process pool
+                instead of going through `joblib.Parallel`, storing each result as soon as its job
+                completes (`simfunc` is sent with `cloudpickle`, as with `"loky"`). `scheduling` and `batch_size` 
+                group jobs with `run_batch`, other `joblib` arguments raise a `ValueError`. With a process-based
+                backend, returning plain data (e.g. `sim.t`, `sim.particles[i].xyz`) instead of
+                `rebound.Simulation` objects keeps the results cheap to send back.
+            warmup : bool, optional
+                Whether to load `REBOUND` in every worker process before dispatching jobs,
+                so that workers do not all import it on their first job.
+                Only used by the `"loky"` and `"processpool"` backends, and by `"loky"` only 
+                when its reusable workers were not warmed up by a previous run. Default is `True`.
         """
         self.features = FEATURES
-        self.cpu_count = os.cpu_count()
+        # number of cores this process may run on (e.g. limited by taskset or containers)
+        if hasattr(os, "sched_getaffinity"):
+            self.cpu_count = len(os.sched_getaffinity(0))
+        else:
+            self.cpu_count = os.cpu_count()
         self.simfunc = simfunc
 
         # get properties of simfunc
@@ -106,7 +273,7 @@ class ReboundParallel():
 
         # if cores is not set, use all but one core (last one to run this)
         if cores is None:
-            self.cores = self.cpu_count - 1
+            self.cores = max(1, self.cpu_count - 1)
         else:
             self.cores = cores
 
@@ -121,9 +288,31 @@ class ReboundParallel():
         else:
             self.port0 = port0
 
+        # if backend is not set, use threads unless simfunc serves a port
+        if backend is None:
+            self.backend = "loky" if self.simfunc_port else "threading"
+        else:
+            self.backend = backend
+        self.warmup = warmup
+
+        self.njobs = None
         self.results = None
+        self.ports_array = None
+        self.open_ports = None
+        self.open_ports_time = 0.
+        self.port_state = {}
+        self.run_finished = threading.Event()
+        self.run_finished.set()
         self.validate_init()
 
+        # one pool of connections reused by every request sent to REBOUND servers,
+        # keeping a connection open to each port (each port is a different host for urllib3)
+        self._http = None
+        if "port" in self.features:
+            self._http = urllib3.PoolManager(num_pools=max(16, self.cores*self.port_buffer), 
+                                             maxsize=2, block=False)
+            weakref.finalize(self, self._http.clear)
+
     def simfunc_check(self)->bool:
         """ Get properties of `simfunc` and check if simfunc is in valid form.
             Returns whether port is an argument.
@@ -136,13 +325,12 @@ class ReboundParallel():
         if callable(self.simfunc) == False:
             raise TypeError(f"simfunc must be a function. {type(self.simfunc)} was passed.")
 
-        if inspect.signature(self.simfunc).parameters.get("port") is None:
-            simfunc_port = False
-        else:
-            simfunc_port = True
+        # introspect simfunc only once, keep the signature for later use
+        self._simfunc_sig = inspect.signature(self.simfunc)
+        params = self._simfunc_sig.parameters
+        simfunc_port = "port" in params
 
-        if (simfunc_port == True and 
-            list(inspect.signature(self.simfunc).parameters).index("port") != 0):
+        if simfunc_port and next(iter(params)) != "port":
             raise TypeError(f"port must be the first argument in {self.simfunc.__name__}")
 
         return simfunc_port
@@ -163,19 +351,27 @@ class ReboundParallel():
         if type(self.progressbar) != bool:
             raise TypeError("progressbar must be a boolean")
 
+        if type(self.backend) != str:
+            raise TypeError("backend must be a string")
+
+        if type(self.warmup) != bool:
+            raise TypeError("warmup must be a boolean")
+
+        self._validated = True
+
     def verify_before_run(self):
         """ Validate ReboundParallel object before parallel running.
             Raises ValueError if any of the parameters are not set.
         """
         if self.njobs is None:
             raise ValueError("njobs must be set before running")
-        if self.ports_array is None:
+        if self.simfunc_port and (self.ports_array is None or len(self.ports_array) == 0):
             raise ValueError("ports_array must be set before running")
 
     def process_jobs(self, jobs):
         """ Process jobs argument. Check if jobs is an integer or an iterable.
             If integer, return a list of length `njobs`.
-            If iterable and 1D, return a (0,1) array (2D).
+            If iterable and 1D, return a (N,1) array (2D), as a view for numpy arrays.
 
             Parameters
             ----------
@@ -188,39 +384,41 @@ class ReboundParallel():
                 Number of jobs to run, or list of arguments to run in parallel (processed).
 
         """
-        # validate jobs type
-        if type(jobs) == int and jobs > 0:
-            self.njobs = jobs
-        elif utils.is_list(jobs):
+        # numpy arrays (or something else similar) are the most common case
+        if hasattr(jobs, "ndim") and utils.is_list(jobs):
             self.njobs = len(jobs)
-        else:
-            raise TypeError("jobs must be a positive integer, list, or numpy array")
+            # if jobs is a 1D array view it as a (N,1) array (no copy)
+            if jobs.ndim == 1 and hasattr(jobs, "reshape"):
+                __jobs = jobs.reshape(-1, 1)
+            elif jobs.ndim == 1:
+                __jobs = list(zip(jobs))
+            # if jobs is a 2D list or numpy array, return as is
+            elif jobs.ndim == 2:
+                __jobs = jobs
+            else:
+                raise ValueError(f"jobs must be a 1 or 2 dimensional array,")
 
-        # if jobs is an integer, create a list of length njobs
-        if type(jobs) == int:
-            __jobs = jobs
+        # if jobs is an integer (including numpy integers), run simfunc jobs times
+        elif isinstance(jobs, numbers.Integral) and not isinstance(jobs, bool):
+            if jobs <= 0:
+                raise TypeError("jobs must be a positive integer, list, or numpy array")
+            self.njobs = __jobs = int(jobs)
 
         # if jobs is a list
-        elif type(jobs) == list:
-            # if jobs is a 1D list create a (0,1) list (2 dimensional)
-            if len(utils.dim(jobs)) == 1:
-                __jobs = [[jobs[i]] for i in range(self.njobs)]
+        elif isinstance(jobs, list):
+            self.njobs = len(jobs)
+            jobs_ndim = len(utils.dim(jobs))
+            # if jobs is a 1D list create a (N,1) list of tuples (2 dimensional)
+            if jobs_ndim == 1:
+                __jobs = list(zip(jobs))
             # if jobs is a 2D list or numpy array, return as is
-            elif len(utils.dim(jobs)) == 2:
+            elif jobs_ndim == 2:
                 __jobs = jobs
             else:
                 raise ValueError(f"jobs must be a 1 or 2 dimensional array")
 
-        # if jobs is a numpy array (or something else similar)
         else:
-            # if jobs is a 1D list create a (0,1) list (2 dimensional)
-            if jobs.ndim == 1:
-                __jobs = [[jobs[i]] for i in range(self.njobs)]
-            # if jobs is a 2D list or numpy array, return as is
-            elif jobs.ndim == 2:
-                __jobs = jobs
-            else:
-                raise ValueError(f"jobs must be a 1 or 2 dimensional array,")
+            raise TypeError("jobs must be a positive integer, list, or numpy array")
     
         return __jobs
 
@@ -232,6 +430,8 @@ class ReboundParallel():
         self.njobs = None
         self.ports_array = None
         self.results = None
+        self.open_ports = None
+        self.port_state = {}
 
     def check_port_feature(self):
         """ Check if port feature is available.
@@ -240,22 +440,39 @@ class ReboundParallel():
         if "port" not in self.features:
             raise ImportError("Please install reboundp with pip install reboundp[port] to use this function.")
     
-    def current_open_ports(self)->List[int]:
+    def current_open_ports(self, max_age:float=0)->List[int]:
         """ Get list of ports currently in use by `REBOUND` servers.
+            Only the ports assigned to jobs (`ports_array`) are probed. A list found less than 
+            `max_age` seconds ago can be reused instead of probing every port again, at the
+            cost of missing sims started in the meantime.
 
             Parameters
             ----------
-            None
+            max_age : float, optional
+                Maximum age (in seconds) of a previously found list of ports to reuse.
+                Default is `0`, which always probes the ports.
 
             Returns
             -------
             open_ports : list
                 List of ports currently in use by `REBOUND` servers
         """
-        open_ports = port_utils.get_rebound_ports(min(self.ports_array), 
-                                    max(self.ports_array) + 2,
-                                    server_path=self.server_path)
-        return open_ports
+        if (self.open_ports is not None and 
+            time.monotonic() - self.open_ports_time < max_age):
+            return list(self.open_ports)
+
+        if self.ports_array is None:
+            return []
+
+        open_ports = port_utils.get_open_ports(sorted(set(self.ports_array)),
+                                               server_path=self.server_path)
+        self.open_ports = open_ports
+        self.open_ports_time = time.monotonic()
+
+        # forget the state of sims no longer served
+        for port in set(self.port_state) - set(open_ports):
+            del self.port_state[port]
+        return list(open_ports)
 
     def send_space(self, port:int):
         """ Send spacebar command to `REBOUND` server at port to pause simulation.
@@ -266,9 +483,13 @@ class ReboundParallel():
                 Port of `REBOUND` server to send spacebar command to
         """
         self.check_port_feature()
-        urllib3.request(method = "GET",
-                        url = f"{self.server_path}:{port}/keyboard/32",
-                        retries = False)
+        self._http.request("GET", f"{self.server_path}:{port}/keyboard/32",
+                           retries = False, timeout = HTTP_TIMEOUT)
+
+        # spacebar toggles between paused and running
+        if port in self.port_state:
+            self.port_state[port] = ("running" if self.port_state[port] == "paused" 
+                                     else "paused")
 
     def send_q(self, port:int):
         """ Send q command to `REBOUND` server at port to end simulation.
@@ -279,9 +500,10 @@ class ReboundParallel():
                 Port of `REBOUND` server to send q command to
         """
         self.check_port_feature()
-        urllib3.request(method = "GET",
-                        url = f"{self.server_path}:{port}/keyboard/81",
-                        retries = 1)
+        # the next job served on this port starts in an unknown state
+        self.port_state.pop(port, None)
+        self._http.request("GET", f"{self.server_path}:{port}/keyboard/81",
+                           retries = 1, timeout = HTTP_TIMEOUT)
 
     def fetch_sim(self, port:int):
         """ Fetch simulation object from `REBOUND` server at port.\n
@@ -299,12 +521,41 @@ class ReboundParallel():
                 Simulation object from `REBOUND` server at port
         """
         self.check_port_feature()
-        reb_request = urllib3.request("GET", 
-                                    f"{self.server_path}:{port}/simulation")
+        reb_request = self._http.request("GET", f"{self.server_path}:{port}/simulation",
+                                         timeout = HTTP_TIMEOUT)
         sim = rebound.Simulation(reb_request.data)
 
+        # only remember states send_space can toggle, a sim that stopped (e.g. "finished")
+        # is replaced by the next job served on this port
+        state = REB_STATUS.get(sim._status)
+        if state in ("running", "paused"):
+            self.port_state[port] = state
+        else:
+            self.port_state.pop(port, None)
+
         return sim
 
+    def sim_state(self, port:int)->str:
+        """ Get state of simulation at port (e.g. `"running"` or `"paused"`).
+            A `"running"` or `"paused"` state is remembered after the first call and updated 
+            by `send_space`, so that the simulation is only fetched from the server once.
+            Any other state is fetched again, since a new job may reuse the port.
+
+            Parameters
+            ----------
+            port : int
+                Port of `REBOUND` server
+
+            Returns
+            -------
+            state : str
+                State of simulation at port, one of `REB_STATUS`
+        """
+        state = self.port_state.get(port)
+        if state not in ("running", "paused"):
+            state = REB_STATUS.get(self.fetch_sim(port)._status)
+        return state
+
     def pause_sim(self, port:int):
         """ Pause simulation at port.
 
@@ -313,7 +564,7 @@ class ReboundParallel():
             port : int
                 Port of `REBOUND` server to pause simulation
         """
-        if REB_STATUS[self.fetch_sim(port)._status] == "running":
+        if self.sim_state(port) == "running":
             self.send_space(port)
 
     def pause_all(self):
@@ -329,7 +580,7 @@ class ReboundParallel():
             port : int
                 Port of `REBOUND` server to unpause simulation
         """
-        if REB_STATUS[self.fetch_sim(port)._status] == "paused":
+        if self.sim_state(port) == "paused":
             self.send_space(port)
 
     def start_all(self):
@@ -352,30 +603,93 @@ class ReboundParallel():
             pass
 
     def end_all_current_sims(self):
-        """ End all simulations available on REBOUND ports."""
-        for port in self.current_open_ports():
-            self.end_sim(port)
+        """ End all simulations available on REBOUND ports.
+            Commands are sent to all ports at once by a pool of threads.
+        """
+        ports = tuple(self.current_open_ports())
+        if len(ports) == 0:
+            return
+
+        with ThreadPoolExecutor(max_workers=min(32, len(ports))) as executor:
+            list(executor.map(self.end_sim, ports))
 
     def end_all(self, sleep_timer:float=0.05, batch_buffer:int=10):
-        """ End all simulations currently available on ports, repeat until all sims have ended.
-            Will wait for `batch_buffer` times the number of batches it took to run the simulations.
-            (This is a heuristic to ensure that all sims end.)
+        """ End all simulations currently available on ports, repeat until all jobs have finished.
+            Sims are ended again every `sleep_timer` seconds to catch jobs started in the meantime,
+            up to `batch_buffer` times the number of batches of jobs (`ceil(njobs / cores)`).
+            Returns as soon as `run` has finished, and warns if it is still running after the last attempt.
 
             Parameters
             ----------
             sleep_timer : float, optional
-                Time to sleep between checking if all sims have ended. Default is 0.01.
+                Time (in seconds) between two attempts at ending all sims. Default is 0.05.
             batch_buffer : int, optional
-                Batch buffer to ensure that all sims are ended. Default is 10.
+                Number of attempts per batch of jobs. Default is 10.
         """
-        nbatches = int(math.ceil(self.njobs / self.cores)) * batch_buffer
         warnings.warn("Ending all tasks ...", UserWarning)
-        for _ in range(nbatches):
+        njobs = self.njobs if self.njobs is not None else 0
+        nattempts = max(1, -(-njobs // self.cores)) * batch_buffer
+        for _ in range(nattempts):
             self.end_all_current_sims()
-            time.sleep(sleep_timer)
+
+            # stop as soon as every job has finished
+            if self.run_finished.wait(sleep_timer):
+                return
+
+        warnings.warn(f"run is still running after {nattempts} attempts at ending all sims, "
+                      "increase batch_buffer to end the remaining jobs", RuntimeWarning)
+
+    def run_executor(self, calls, ncalls:int, t0:float, 
+                     task_jobs:List[int]=None, completed_jobs:int=0)->List:
+        """ Run calls with a `loky` process pool (`backend="processpool"`).
+            Results are stored as soon as each call completes.
+            Calls are pickled with `cloudpickle`, so functions decorated with `ReboundParallel` can be sent.
+
+            Parameters
+            ----------
+            calls : iterable
+                `(function, args, kwargs)` tuples to run
+            ncalls : int
+                Number of calls
+            t0 : float
+                Start time of the run, for the progress bar
+            task_jobs : list of int, optional
+                Number of jobs run by each call, for the progress bar. 
+                Default is `None`, which counts one job per call.
+            completed_jobs : int, optional
+                Number of jobs already completed before these calls. Default is `0`.
+
+            Returns
+            -------
+            results : list
+                List of results, in the same order as `calls`
+        """
+        results = [None] * ncalls
+        initializer = warmup_worker if self.warmup else None
+        # a new pool (not joblib's reusable one, whose options joblib manages) shut down
+        # at the end of the run, so that no worker keeps a sim serving a port
+        with LokyProcessPoolExecutor(max_workers=self.cores, initializer=initializer) as executor:
+            futures = {executor.submit(func, *args, **kwargs): i 
+                       for i, (func, args, kwargs) in enumerate(calls)}
+
+            last_print = time.monotonic()
+            for future in as_completed(futures):
+                i = futures[future]
+                results[i] = future.result()
+                completed_jobs += 1 if task_jobs is None else task_jobs[i]
+
+                # only update every PROGRESS_INTERVAL seconds, and at the end
+                now = time.monotonic()
+                if self.progressbar and (completed_jobs >= self.njobs or 
+                                         now - last_print > PROGRESS_INTERVAL):
+                    last_print = now
+                    print_progress(completed_jobs-1, self.njobs, t0)
+        return results
 
     def run(self, jobs, cores:int=None, progressbar:bool=None, 
-            *joblib_args, **joblib_kwargs)->List:
+            *joblib_args, scheduling:str=None, cost_hint:callable=None,
+            chunk_size=1, cache:str=None, result_format:str="aos", 
+            **joblib_kwargs)->List:
         """ Run jobs in parallel.
 
             Parameters
@@ -394,84 +708,250 @@ class ReboundParallel():
             progressbar : bool, optional
                 Whether to print a progress bar to stdout. 
                 If not set, will use value from initialization (default False).
+            scheduling : str, optional
+                How jobs are distributed to the workers. Ignored when running on 1 core.
+
+                1. `None` (default): let `joblib` pick the batch size automatically.
+                1. `"static"`: split the jobs into one contiguous batch per core.
+                1. `"dynamic"`: dispatch one job at a time, best for jobs with very different runtimes.
+                1. `"guided"`: dispatch batches of decreasing size, `ceil(remaining / (2 * cores))` jobs each.
+                1. `"profile"`: run the first job in this process to time it, then dispatch batches
+                of jobs taking about 0.5 seconds each, see `utils.profile_batch_size`.
+            cost_hint : callable, optional
+                Function taking the arguments of one job (`jobs[i]`) and returning its estimated runtime.
+                If set, jobs are dispatched from most to least expensive so that slow jobs do not 
+                end up last, leaving cores idle. Results are still returned in the order of `jobs`.
+                E.g. `utils.cost_by_eccentricity` for sweeps over eccentricity.
+                Default is `None`, which dispatches jobs in order.
+            chunk_size : int or str, optional
+                Number of jobs run one after the other by a worker in a single task.
+                Larger chunks cut the dispatch overhead of many short jobs.
+                If `"auto"`, use `utils.auto_chunk_size(njobs, cores)`. Cannot be combined 
+                with `scheduling="guided"` or `"profile"`, which pick their own chunks. Default is `1`.
+            cache : str, optional
+                Directory in which results of `simfunc` are cached with `joblib.Memory`.
+                Jobs already run with the same arguments are loaded from the cache instead 
+                of being run again. `port` is not part of the cached arguments.
+                Default is `None`, which does not cache results.
+            result_format : str, optional
+                Layout of the returned results.
+
+                1. `"aos"` (default): a list with the result of each job, e.g. `[(sim, ecc, xyz), ...]`.
+                1. `"soa"`: a tuple with one column per value returned by `simfunc`, 
+                e.g. `(sims, eccs, xyzs)`, see `utils.to_columns`.
             *joblib_args : optional
                 Additional arguments to pass to joblib.Parallel
             **joblib_kwargs : optional
-                Additional keyword arguments to pass to joblib.Parallel
+                Additional keyword arguments to pass to joblib.Parallel.
+                E.g. `max_nbytes` and `mmap_mode` control when large numpy arrays passed to 
+                `simfunc` are memory-mapped to worker processes instead of pickled.
 
             Returns
             -------
             results : List
-                List of results from running jobs in parallel        
+                List of results from running jobs in parallel (or tuple of columns if `result_format="soa"`)        
         """
         # reset before running
         self.reset_run()
 
         # validate and process jobs argument
         jobs = self.process_jobs(jobs)
+        count_only = isinstance(jobs, int)
+
+        if scheduling not in SCHEDULING:
+            raise ValueError(f"scheduling must be one of {SCHEDULING}")
+
+        if result_format not in RESULT_FORMATS:
+            raise ValueError(f"result_format must be one of {RESULT_FORMATS}")
+
+        # dispatch most expensive jobs first
+        order = None
+        if cost_hint is not None and not count_only:
+            costs = [cost_hint(jobs[i]) for i in range(self.njobs)]
+            order = sorted(range(self.njobs), key=costs.__getitem__, reverse=True)
+            jobs = [jobs[i] for i in order]
 
         # handle cores and progressbar arguments
         if cores is not None: self.cores = cores
         if progressbar is not None: self.progressbar = progressbar
+
+        # validate parameters again if they changed since the last check
+        if not self._validated: self.validate_init()
+
         if self.progressbar and self.cores == 1: 
             print("Running in serial mode.")
         elif self.progressbar and self.cores > 1:
             print(f"Running in parallel mode with {self.cores} cores.")
         
-
-        # assign ports to jobs
-        job_list = list(range(0, self.njobs))
-        port1 = self.port0 + 1
-        core_buffer = self.cores * self.port_buffer
-        self.ports_array = [(port1 + (port%core_buffer)) for port in job_list]
+        # validate chunk_size argument
+        if chunk_size == "auto":
+            chunk_size = utils.auto_chunk_size(self.njobs, self.cores)
+        elif (not isinstance(chunk_size, int) or isinstance(chunk_size, bool) or 
+              chunk_size < 1):
+            raise TypeError("chunk_size must be a non-zero positive integer or 'auto'")
+        if chunk_size != 1 and scheduling in ("guided", "profile"):
+            raise ValueError(f"chunk_size cannot be used with {scheduling} scheduling")
+
+        # the process pool only takes the batch size of all joblib options
+        if joblib_kwargs.get("backend", self.backend) == "processpool":
+            unsupported = sorted(set(joblib_kwargs) - {"backend", "batch_size"})
+            if joblib_args or unsupported:
+                raise ValueError(f"joblib arguments {unsupported or list(joblib_args)} "
+                                 "cannot be used with the processpool backend")
+
+        # assign ports to jobs, cycling through cores * port_buffer ports
+        # (only needed if simfunc serves a port)
+        if self.simfunc_port:
+            port1 = self.port0 + 1
+            core_buffer = self.cores * self.port_buffer
+            ncycles = -(-self.njobs // core_buffer)
+            self.ports_array = (array.array("i", range(port1, port1 + core_buffer)) 
+                                * ncycles)[:self.njobs]
 
         # validate before running
-        self.validate_init()
         self.verify_before_run()
 
         # track progress
-        __n_completed_tasks = 0
         __t0 = time.time()
-        if self.progressbar: print_progress(__n_completed_tasks, self.njobs, __t0)
+        if self.progressbar: print_progress(0, self.njobs, __t0)
 
-        if self.cores == 1:
-            # output list
-            results = []
+        # bind once instead of looking up attributes for every job
+        fn = self.simfunc
+        ports = self.ports_array
+        with_port = self.simfunc_port
 
-            for i in range(self.njobs):
-                if type(jobs) == int:
-                    results.append(self.simfunc())
-                else:
-                    if self.simfunc_port:
-                        results.append(self.simfunc(self.ports_array[i],
-                                                    *jobs[i]))
+        # reuse results of jobs already run with the same arguments
+        if cache is not None:
+            fn = joblib.Memory(cache, verbose=0).cache(
+                    fn, ignore=["port"] if with_port else None)
+
+        # signal end_all once every job has finished
+        self.run_finished.clear()
+        try:
+            if self.cores == 1:
+                # output list, one slot per job
+                results = [None] * self.njobs
+
+                for i in range(self.njobs):
+                    if count_only:
+                        results[i] = fn()
+                    elif with_port:
+                        results[i] = fn(ports[i], *jobs[i])
                     else:
-                        results.append(self.simfunc(*jobs[i]))
+                        results[i] = fn(*jobs[i])
                 
-                if __n_completed_tasks+1 < self.njobs:
-                    print_progress(__n_completed_tasks+1, self.njobs, __t0)
-                __n_completed_tasks += 1
-        else:
-            # run jobs in parallel
-            joblib.parallel.BatchCompletionCallBack = TimedBatchCompletionCallBack
-            with Parallel(n_jobs=self.cores, 
-                          *joblib_args, **joblib_kwargs) as parallel:
-                # track progress
-                parallel.joblib_n_jobs = self.njobs
-                parallel.progressbar = self.progressbar
-                parallel.joblib_t0 = __t0
-
-                if type(jobs) == int:
-                    results = parallel(delayed(self.simfunc)() 
-                                       for i in range(self.njobs))
+                    if self.progressbar and i+1 < self.njobs:
+                        print_progress(i+1, self.njobs, __t0)
+            else:
+                # arguments passed to simfunc for each job
+                if count_only:
+                    tasks = (() for i in range(self.njobs))
+                elif with_port:
+                    tasks = ((ports[i], *jobs[i]) for i in range(self.njobs))
+                else:
+                    tasks = (tuple(jobs[i]) for i in range(self.njobs))
+
+                # run the first job here to measure how long one job takes
+                first_results = []
+                if scheduling == "profile":
+                    t_one = time.perf_counter()
+                    first_result = fn(*next(tasks))
+                    t_one = time.perf_counter() - t_one
+
+                    # a sim returned here keeps serving its port in this process,
+                    # copy the result through pickle as if it came back from a worker
+                    if with_port:
+                        first_result = pickle.loads(pickle.dumps(first_result))
+                    first_results.append(first_result)
+
+                # group jobs into batches run serially by one worker
+                if scheduling == "guided":
+                    batches = utils.guided_chunks(list(tasks), self.cores)
+                elif chunk_size != 1:
+                    batches = utils.fixed_chunks(list(tasks), chunk_size)
                 else:
-                    if self.simfunc_port:
-                        results = parallel(delayed(self.simfunc)(
-                            self.ports_array[i], *jobs[i]) 
-                            for i in range(self.njobs))
+                    batches = None
+
+                ntasks = (len(batches) if batches is not None else 
+                          self.njobs - len(first_results))
+
+                # map scheduling strategy to joblib batching
+                if scheduling == "static":
+                    joblib_kwargs.setdefault("batch_size", 
+                                             max(1, ntasks // self.cores))
+                elif scheduling == "dynamic":
+                    joblib_kwargs.setdefault("batch_size", 1)
+                elif scheduling == "profile":
+                    joblib_kwargs.setdefault("batch_size", 
+                                             utils.profile_batch_size(t_one, self.njobs, self.cores))
+                else:
+                    joblib_kwargs.setdefault("batch_size", "auto")
+                joblib_kwargs.setdefault("backend", self.backend)
+
+                # the process pool does not batch tasks, group them here as joblib would
+                batch_size = joblib_kwargs["batch_size"]
+                if (joblib_kwargs["backend"] == "processpool" and 
+                    batch_size != "auto" and batch_size > 1):
+                    if batches is None:
+                        batches = utils.fixed_chunks(list(tasks), batch_size)
                     else:
-                        results = parallel(delayed(self.simfunc)(*jobs[i])
-                                        for i in range(self.njobs))
+                        batches = [[args for batch in group for args in batch]
+                                   for group in utils.fixed_chunks(batches, batch_size)]
+                    ntasks = len(batches)
+
+                # build the (function, args, kwargs) tuples that `delayed` would return,
+                # without wrapping `simfunc` again for every job
+                if batches is not None:
+                    calls = ((run_batch, (fn, batch), {}) for batch in batches)
+                    # number of jobs run by each task, for the progress bar
+                    task_jobs = [len(batch) for batch in batches]
+                else:
+                    calls = ((fn, args, {}) for args in tasks)
+                    task_jobs = None
+
+                # run jobs in parallel
+                joblib.parallel.BatchCompletionCallBack = TimedBatchCompletionCallBack
+
+                results = []
+                if ntasks > 0 and joblib_kwargs["backend"] == "processpool":
+                    results = self.run_executor(calls, ntasks, __t0, task_jobs, 
+                                                len(first_results))
+                elif ntasks > 0:
+                    with Parallel(n_jobs=self.cores, 
+                                  *joblib_args, **joblib_kwargs) as parallel:
+                        # load REBOUND once in every new loky worker process (workers are reused by joblib)
+                        if self.warmup and joblib_kwargs["backend"] == "loky":
+                            warmup_loky_workers(parallel, self.cores)
+
+                        # track progress in jobs, including the ones already run here
+                        parallel.joblib_n_jobs = self.njobs
+                        parallel.joblib_completed_jobs = len(first_results)
+                        parallel.joblib_task_ends = (None if task_jobs is None else
+                                                     [0, *itertools.accumulate(task_jobs)])
+                        parallel.joblib_lock = threading.Lock()
+                        parallel.progressbar = self.progressbar
+                        parallel.joblib_t0 = __t0
+                        parallel.joblib_last_print = time.monotonic()
+
+                        results = parallel(calls)
+                results = first_results + results
+
+                # flatten batches of results back to one result per job
+                if batches is not None:
+                    results = [result for batch in results for result in batch]
+        finally:
+            self.run_finished.set()
+
+        # restore the order of jobs
+        if order is not None:
+            ordered_results = [None] * self.njobs
+            for i, result in zip(order, results):
+                ordered_results[i] = result
+            results = ordered_results
+
+        # one column per value returned by simfunc
+        if result_format == "soa":
+            results = utils.to_columns(results)
 
         self.results = results
         return results
@@ -3,6 +3,11 @@
 
 import socket
 
+# bound once, used on every probe of a port scan
+_socket = socket.socket
+_AF_INET = socket.AF_INET
+_SOCK_STREAM = socket.SOCK_STREAM
+
 def first_available_port() -> int:
     """ Get the first available port on localhost.
         From: https://stackoverflow.com/questions/1365265/on-localhost-how-do-i-pick-a-free-port-number
@@ -34,19 +39,22 @@ def is_port_in_use(server_path:str, port: int) -> bool:
         is_port_in_use: bool
             True if port is in use, False otherwise
     """
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s = _socket(_AF_INET, _SOCK_STREAM)
 
     output = False
     try:
         s.bind((server_path, port))
         output = False
-    except:
+    except (OSError, OverflowError):
+        # port is taken (or cannot be bound at all)
         output = True
-    s.close()
+    finally:
+        s.close()
     return output
 
 def get_rebound_ports(port0:int, port1:int, server_path:str) -> list:
-    """ Get list of ports in use by Rebound servers.
+    """ Get list of ports in use by Rebound servers, between `port0` and `port1`.
+        See `get_open_ports`.
 
         Parameters
         ----------
@@ -62,12 +70,37 @@ def get_rebound_ports(port0:int, port1:int, server_path:str) -> list:
         rebound_ports : list
             List of ports in use by Rebound servers
     """
+    return get_open_ports(range(port0, port1), server_path)
+
+def get_open_ports(ports, server_path:str) -> list:
+    """ Get list of ports in use among the given ports.
+        Probing a port only tries to bind a local socket, which never waits on the network,
+        so ports are probed one after the other.
+
+        Parameters
+        ----------
+        ports : iterable
+            Ports to check
+        server_path : str
+            Address of server. E.g. "http://localhost"
+
+        Returns
+        -------
+        open_ports : list
+            List of ports in use, in the same order as `ports`
+    """
     if server_path.startswith("http://"):
         server_path = server_path.replace("http://", "")
 
+    ports = list(ports)
+    if len(ports) == 0:
+        return []
+
+    # resolve the address once instead of at every bind
+    try:
+        server_path = socket.gethostbyname(server_path)
+    except socket.gaierror:
+        pass
+
     # get list of ports in use
-    rebound_ports = []
-    for port in range(port0, port1):
-        if is_port_in_use(server_path, port):
-            rebound_ports.append(port)
-    return rebound_ports
\ No newline at end of file
+    return [port for port in ports if is_port_in_use(server_path, port)]
@@ -1,10 +1,20 @@
 # author: Dang Pham
 # last modified: December 2023
 
+import math, numbers
 from typing import List
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# types accepted (or rejected) by is_list without further checks
+LIST_TYPES = (list,) if np is None else (list, np.ndarray)
+NOT_LIST_TYPES = (dict, tuple, str, bytes, int, float, bool, type(None))
+
 def dim(x)->List[int]:
-    """ Return the dimension of a list of lists. 
+    """ Return the dimension of a list of lists (or the shape of a numpy array). 
         From https://stackoverflow.com/questions/1952464/in-python-how-do-i-determine-if-an-object-is-iterable
 
         Parameters
@@ -17,9 +27,16 @@ def dim(x)->List[int]:
         dim : list
             Dimension of list
     """
-    if not type(x) == list:
-        return []
-    return [len(x)] + dim(x[0])
+    if np is not None and isinstance(x, np.ndarray):
+        return list(x.shape)
+
+    # follow the first item of each nested list (an empty list ends the walk)
+    dims = []
+    while type(x) == list:
+        dims.append(len(x))
+        if len(x) == 0: break
+        x = x[0]
+    return dims
 
 def is_list(x)->bool:
     """ Check if object is a list, tuple, or numpy array.
@@ -34,14 +51,18 @@ def is_list(x)->bool:
         is_list : bool
             True if object is a list, tuple, or numpy array. False otherwise.
     """
-    if type(x) in [dict, tuple, str, int, float, bool]:
+    if isinstance(x, LIST_TYPES):
+        # 0-d numpy arrays cannot be iterated over
+        return getattr(x, "ndim", 1) > 0
+    if isinstance(x, NOT_LIST_TYPES):
         return False
-    else:
-        try:
-            iter(x)
-            return True
-        except TypeError:
-            return False
+    return hasattr(type(x), "__iter__")
+
+# formatters used by time_format
+FORMAT_DAY = "{:01d}days {:02d}h{:02d}m{:02d}s".format
+FORMAT_HOUR = "{:02d}h{:02d}m{:02d}s".format
+FORMAT_MINUTE = "{:02d}m{:02d}s".format
+FORMAT_SECOND = "{:.2f}s".format
 
 def time_format(seconds: float) -> str:
     """ Convert seconds to human readable format.
@@ -58,18 +79,159 @@ def time_format(seconds: float) -> str:
     """
     # TODO: remove this
     # seconds += 3600 * 5 + 60 * 30
-    seconds_in_hour = 3600
+    # most progressbar ticks are under a minute, skip the divmods
+    if seconds < 60:
+        return FORMAT_SECOND(seconds)
 
-    day = int(seconds) // (seconds_in_hour * 24)
-    hour = (int(seconds) // seconds_in_hour) % 24
-    minute = (int(seconds) % seconds_in_hour) // 60
-    sec = (int(seconds) % seconds_in_hour) % 60
+    minutes, sec = divmod(int(seconds), 60)
+    hours, minute = divmod(minutes, 60)
+    day, hour = divmod(hours, 24)
 
     if day > 0:
-        return "{:01d}days {:02d}h{:02d}m{:02d}s".format(day, hour, minute, sec)
+        return FORMAT_DAY(day, hour, minute, sec)
     elif hour > 0:
-        return "{:02d}h{:02d}m{:02d}s".format(hour, minute, sec)
-    elif minute > 0:
-        return "{:02d}m{:02d}s".format(minute, sec)
+        return FORMAT_HOUR(hour, minute, sec)
     else:
-        return "{:.2f}s".format(seconds)
\ No newline at end of file
+        return FORMAT_MINUTE(minute, sec)
+
+def guided_chunks(x:list, n:int)->List[list]:
+    """ Split a list into chunks of decreasing size for guided scheduling.
+        Each chunk holds `ceil(remaining / (2 * n))` items.
+
+        Parameters
+        ----------
+        x : list
+            List to split
+        n : int
+            Number of workers
+
+        Returns
+        -------
+        chunks : list
+            List of chunks, in the same order as `x`
+    """
+    chunks = []
+    start = 0
+    while start < len(x):
+        size = math.ceil((len(x) - start) / (2 * n))
+        chunks.append(x[start:start + size])
+        start += size
+    return chunks
+
+def fixed_chunks(x:list, size:int)->List[list]:
+    """ Split a list into contiguous chunks of `size` items (the last one may be shorter).
+
+        Parameters
+        ----------
+        x : list
+            List to split
+        size : int
+            Number of items per chunk
+
+        Returns
+        -------
+        chunks : list
+            List of chunks, in the same order as `x`
+    """
+    return [x[start:start + size] for start in range(0, len(x), size)]
+
+def auto_chunk_size(njobs:int, cores:int)->int:
+    """ Pick a chunk size giving each worker about 4 chunks, 
+        enough to balance the load while cutting the dispatch overhead of short jobs.
+
+        Parameters
+        ----------
+        njobs : int
+            Number of jobs
+        cores : int
+            Number of workers
+
+        Returns
+        -------
+        chunk_size : int
+            Number of jobs per chunk
+    """
+    return max(1, njobs // (cores * 4))
+
+def profile_batch_size(t_one:float, njobs:int, cores:int, target:float=0.5)->int:
+    """ Pick a batch size from the measured runtime of one job, so that a batch runs 
+        for about `target` seconds, while giving each worker at least 4 batches.
+
+        Parameters
+        ----------
+        t_one : float
+            Runtime of one job (in seconds)
+        njobs : int
+            Number of jobs
+        cores : int
+            Number of workers
+        target : float, optional
+            Target runtime of one batch (in seconds). Default is `0.5`.
+
+        Returns
+        -------
+        batch_size : int
+            Number of jobs per batch
+    """
+    batch_size = int(target / t_one) if t_one > 0 else njobs
+    return max(1, min(batch_size, njobs // (cores * 4)))
+
+def cost_by_eccentricity(args)->float:
+    """ Estimate the relative runtime of a job from the eccentricity of its orbit.
+        For use as `cost_hint` in `ReboundParallel.run` when the first argument of 
+        each job is an eccentricity: close pericenter passages of eccentric orbits 
+        are the slowest to integrate, the cost grows as `(1 - e)^(-3/2)`.
+
+        Parameters
+        ----------
+        args : list
+            Arguments of one job, eccentricity first
+
+        Returns
+        -------
+        cost : float
+            Estimated relative runtime
+    """
+    return 1. / (1. - min(args[0], 1. - 1e-12))**1.5
+
+def to_columns(rows:list)->tuple:
+    """ Convert a list of results (one tuple per job) into a tuple of columns (one per value).
+        Columns of numbers or of equally shaped arrays become numpy arrays (if numpy is installed),
+        e.g. an `(N,3)` array for `xyz`. Other columns (e.g. `rebound.Simulation`) become object arrays.
+        If results are not tuples, return a single column.
+
+        Parameters
+        ----------
+        rows : list
+            List of results, one per job
+
+        Returns
+        -------
+        columns : tuple
+            Tuple of columns, each with one item per job
+    """
+    if len(rows) > 0 and all(type(row) == tuple for row in rows):
+        columns = list(zip(*rows))
+    else:
+        columns = [rows]
+
+    if np is None:
+        return tuple(list(column) for column in columns)
+    return tuple(_column_array(column) for column in columns)
+
+def _column_array(column):
+    """ Convert a column of results to a numpy array, without unpacking objects."""
+    if len(column) > 0 and all(isinstance(x, (numbers.Number, list, np.ndarray)) 
+                               for x in column):
+        try:
+            array = np.asarray(column)
+            if array.dtype != object:
+                return array
+        except ValueError:
+            pass
+
+    # fill one by one so that numpy does not look inside the objects
+    array = np.empty(len(column), dtype=object)
+    for i, x in enumerate(column):
+        array[i] = x
+    return array
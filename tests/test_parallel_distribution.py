@@ -1,7 +1,10 @@
 import unittest
 from reboundp import ReboundParallel
+from reboundp import parallel
 import rebound
 import numpy as np
+from joblib import Parallel
+import os, tempfile, io, re, contextlib
 
 def setup_sim(port, sim_id):
     # set up Solar System simulation
@@ -46,6 +49,15 @@ def setup_sim_noport(sim_id):
 
     return sim, sim_id, t_arr, jupiter_xyz
 
+def port_and_id(port, sim_id):
+    # takes a port without starting a REBOUND server on it
+    return port, sim_id
+
+@ReboundParallel
+def sim_id_decorated(sim_id):
+    # decorated at module level, so this name is not the function sent to workers
+    return sim_id
+
 def setup_sim_int():
     # set up Solar System simulation
     sim = rebound.Simulation()
@@ -150,6 +162,14 @@ class TestInitialization(unittest.TestCase):
         self.assertRaises(TypeError, lambda: ReboundParallel(
             simfunc = simfunc2,progressbar=False,port_buffer=5,port0="6000"))
 
+        # test backend arg
+        self.assertRaises(TypeError, lambda: ReboundParallel(
+            simfunc = setup_sim, cores=2, backend=1))
+
+        # test warmup arg
+        self.assertRaises(TypeError, lambda: ReboundParallel(
+            simfunc = setup_sim, cores=2, warmup="yes"))
+
     def test_verify_before_run(self):
         # test validation of run jobs
         rebp = ReboundParallel(simfunc = setup_sim, cores=5, 
@@ -164,6 +184,16 @@ class TestInitialization(unittest.TestCase):
             rebp.ports_array = None
             rebp.verify_before_run()
 
+    def test_revalidate(self):
+        rebp = ReboundParallel(simfunc = setup_sim, cores=2)
+        self.assertTrue(rebp._validated)
+
+        # test that changing a parameter validates it again before running
+        rebp.port_buffer = 0
+        self.assertFalse(rebp._validated)
+        with self.assertRaises(TypeError):
+            rebp.run(jobs=2)
+
     def test_get_simfunc_type(self):
         rebp = ReboundParallel(simfunc = setup_sim)
         simfunc_port = rebp.simfunc_check()
@@ -173,6 +203,38 @@ class TestInitialization(unittest.TestCase):
         simfunc_port = rebp.simfunc_check()
         self.assertEqual(simfunc_port, False)
 
+    def test_backend(self):
+        # simfunc with port defaults to processes, without port to threads
+        rebp = ReboundParallel(simfunc = setup_sim, cores=2)
+        self.assertEqual(rebp.backend, "loky")
+
+        rebp = ReboundParallel(simfunc = setup_sim_noport, cores=2)
+        self.assertEqual(rebp.backend, "threading")
+
+        rebp = ReboundParallel(simfunc = setup_sim_noport, cores=2,
+                               backend="loky")
+        self.assertEqual(rebp.backend, "loky")
+        results = rebp.run(jobs=np.arange(0, 4, 1))
+        self.assertEqual(len(results), 4)
+
+    def test_warmup(self):
+        rebp = ReboundParallel(simfunc = setup_sim, cores=2)
+        rebp.run(jobs=np.arange(0, 2, 1))
+
+        # check that loky workers already warmed up are not warmed up again,
+        # unless the number of workers changes
+        with Parallel(n_jobs=2, backend="loky") as joblib_parallel:
+            self.assertFalse(parallel.warmup_loky_workers(joblib_parallel, 2))
+        with Parallel(n_jobs=3, backend="loky") as joblib_parallel:
+            self.assertTrue(parallel.warmup_loky_workers(joblib_parallel, 3))
+            self.assertFalse(parallel.warmup_loky_workers(joblib_parallel, 3))
+
+        # check that runs with options changing the executor reuse the executor warmed up
+        rebp.run(jobs=np.arange(0, 4, 1), max_nbytes=None)
+        key = parallel.loky_executor_key()
+        rebp.run(jobs=np.arange(0, 4, 1), max_nbytes=None)
+        self.assertEqual(parallel.loky_executor_key(), key)
+
     def test_process_jobs(self):
         jobs = np.arange(0, 10, 1)
         rebp = ReboundParallel(simfunc = setup_sim)
@@ -195,6 +257,11 @@ class TestInitialization(unittest.TestCase):
         proc_jobs = rebp.process_jobs(jobs)
         self.assertEqual(proc_jobs, jobs)
 
+        jobs = np.int64(10)
+        proc_jobs = rebp.process_jobs(jobs)
+        self.assertEqual(proc_jobs, 10)
+        self.assertEqual(rebp.njobs, 10)
+
         with self.assertRaises(TypeError):
             jobs = "Not a list or int"
             proc_jobs = rebp.process_jobs(jobs)
@@ -253,6 +320,128 @@ class TestInitialization(unittest.TestCase):
         # test that results are returned for every job
         self.assertEqual(len(results), 10)
     
+    def test_run_scheduling(self):
+        jobs = np.arange(0, 10, 1)
+        rebp = ReboundParallel(simfunc = setup_sim, cores=2)
+
+        # test that every scheduling returns results in job order
+        for scheduling in ["static", "dynamic", "guided", "profile"]:
+            results = rebp.run(jobs=jobs, scheduling=scheduling)
+            self.assertEqual([result[1] for result in results], jobs.tolist())
+
+        # test that the port of the job profiled here is free for the next job using it
+        rebp = ReboundParallel(simfunc = setup_sim, cores=2, port_buffer=1)
+        results = rebp.run(jobs=np.arange(0, 3, 1), scheduling="profile")
+        self.assertEqual([result[1] for result in results], [0, 1, 2])
+
+        with self.assertRaises(ValueError):
+            rebp.run(jobs=jobs, scheduling="not a scheduling")
+
+    def test_run_chunk_size(self):
+        jobs = np.arange(0, 10, 1)
+        rebp = ReboundParallel(simfunc = setup_sim, cores=2)
+
+        # test that chunked jobs return results in job order
+        for chunk_size in [3, "auto"]:
+            results = rebp.run(jobs=jobs, chunk_size=chunk_size)
+            self.assertEqual([result[1] for result in results], jobs.tolist())
+
+        with self.assertRaises(TypeError):
+            rebp.run(jobs=jobs, chunk_size=0)
+        with self.assertRaises(ValueError):
+            rebp.run(jobs=jobs, chunk_size=3, scheduling="guided")
+
+    def test_run_progress(self):
+        jobs = np.arange(0, 10, 1)
+        rebp = ReboundParallel(simfunc = setup_sim_noport, cores=2, progressbar=True)
+
+        # test that the progress bar counts jobs, also when jobs are run in batches
+        for kwargs in [{"chunk_size": 3}, {"scheduling": "guided"}, {"scheduling": "profile"}]:
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                rebp.run(jobs=jobs, **kwargs)
+            counts = re.findall(r"\[(\d+)/(\d+) Tasks\]", output.getvalue())
+            self.assertEqual({total for _, total in counts}, {"10"})
+            self.assertEqual(counts[-1][0], "10")
+            self.assertIn("Finished running 10 tasks", output.getvalue())
+
+    def test_run_processpool(self):
+        jobs = np.arange(0, 6, 1)
+        rebp = ReboundParallel(simfunc = setup_sim, cores=2, backend="processpool",
+                               progressbar=True)
+
+        # test that results are returned in job order, also in batches
+        for chunk_size in [1, 4]:
+            results = rebp.run(jobs=jobs, chunk_size=chunk_size)
+            self.assertEqual([result[1] for result in results], jobs.tolist())
+            self.assertIsInstance(results[0][0], rebound.Simulation)
+
+        # test that scheduling groups jobs in batches, also on top of chunk_size
+        for kwargs in [{"scheduling": "static"}, {"scheduling": "static", "chunk_size": 2}, 
+                       {"batch_size": 4}, {"scheduling": "profile"}]:
+            results = rebp.run(jobs=jobs, **kwargs)
+            self.assertEqual([result[1] for result in results], jobs.tolist())
+
+        # test that functions decorated with ReboundParallel can be sent to workers
+        results = sim_id_decorated.run(jobs, cores=2, backend="processpool")
+        self.assertEqual(results, jobs.tolist())
+
+        # test that options only joblib understands are rejected
+        with self.assertRaises(ValueError):
+            rebp.run(jobs, None, None, 2)
+        with self.assertRaises(ValueError):
+            rebp.run(jobs=jobs, max_nbytes=None)
+
+    def test_run_cost_hint(self):
+        jobs = np.arange(0, 10, 1)
+        rebp = ReboundParallel(simfunc = setup_sim, cores=2)
+
+        # test that results come back in job order when dispatched by cost
+        results = rebp.run(jobs=jobs, cost_hint=lambda args: args[0])
+        self.assertEqual([result[1] for result in results], jobs.tolist())
+
+    def test_run_soa(self):
+        jobs = np.arange(0, 4, 1)
+        rebp = ReboundParallel(simfunc = setup_sim_noport, cores=2)
+        sims, sim_ids, t_arrs, jupiter_xyzs = rebp.run(jobs=jobs, result_format="soa")
+
+        # test that each column holds one item per job
+        self.assertIsInstance(sims[0], rebound.Simulation)
+        self.assertEqual(sim_ids.tolist(), jobs.tolist())
+        self.assertEqual(jupiter_xyzs.shape, (4, 100, 3))
+
+        with self.assertRaises(ValueError):
+            rebp.run(jobs=jobs, result_format="not a format")
+
+    def test_ports_array(self):
+        jobs = np.arange(0, 10, 1)
+        rebp = ReboundParallel(simfunc = port_and_id, cores=2, port_buffer=2)
+        results = rebp.run(jobs=jobs)
+
+        # test that ports cycle through cores * port_buffer ports, and reach the jobs
+        ports = [rebp.port0 + 1 + (i % 4) for i in range(10)]
+        self.assertEqual(list(rebp.ports_array), ports)
+        self.assertEqual(results, list(zip(ports, jobs)))
+
+        # test that no ports are assigned if simfunc does not take port
+        rebp = ReboundParallel(simfunc = setup_sim_noport, cores=2)
+        rebp.run(jobs=jobs)
+        self.assertIsNone(rebp.ports_array)
+
+    def test_run_cache(self):
+        jobs = np.arange(0, 3, 1)
+        rebp = ReboundParallel(simfunc = setup_sim_noport, cores=2)
+
+        with tempfile.TemporaryDirectory() as cache:
+            results = rebp.run(jobs=jobs, cache=cache)
+            self.assertTrue(len(os.listdir(cache)) > 0)
+
+            # test that cached results match the first run
+            cached_results = rebp.run(jobs=jobs, cache=cache)
+            self.assertEqual([result[1] for result in cached_results], 
+                             [result[1] for result in results])
+            self.assertEqual(cached_results[0][0].t, results[0][0].t)
+
     def test_run_serial(self):
         jobs = np.arange(0, 3, 1)
         rebp = ReboundParallel(simfunc = setup_sim_noport, cores=1)
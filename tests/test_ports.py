@@ -2,11 +2,13 @@ import unittest
 from reboundp import ReboundParallel
 import rebound
 import numpy as np
-import threading, time
+import threading, time, socket, warnings
 
 MAXT = 1e5
+# sims that are expected to finish on their own only need a short run
+SHORT_MAXT = 1e3
 
-def setup_sim(port, _):
+def setup_sim(port, _, tmax=MAXT):
     # set up Solar System simulation
     sim = rebound.Simulation()
     sim.add("Solar System")
@@ -16,14 +18,52 @@ def setup_sim(port, _):
     # enable server
     sim.start_server(port=port)
 
-    # integrate for MAXT years
+    # integrate for tmax years
     # save particle's position
-    sim.integrate(MAXT)
+    sim.integrate(tmax)
     xyz = sim.particles[1].xyz 
 
     return sim, xyz
 
+def setup_sim_until(port, tmax):
+    # same as setup_sim, with the end time passed as the job
+    return setup_sim(port, None, tmax)
+
 class TestPorts(unittest.TestCase):
+    def setUp(self):
+        # control threads started by this test, stopped in tearDown
+        self.stopped = threading.Event()
+        self.threads = []
+
+    def tearDown(self):
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join(timeout=1.)
+
+    def when_running(self, rebp, nsims, action, timeout=10.):
+        # run action in a thread as soon as nsims REBOUND sims are integrating,
+        # instead of sleeping for a fixed time and hoping the sims have started
+        def running():
+            ports = rebp.current_open_ports()
+            try:
+                return (len(ports) >= nsims and 
+                        all(rebp.fetch_sim(port)._status == -1 for port in ports))
+            except Exception:
+                # server closed between the probe and the fetch
+                return False
+
+        def wait():
+            t_end = time.monotonic() + timeout
+            while not running() and time.monotonic() < t_end:
+                if self.stopped.wait(0.01):
+                    # test is over, leave its ports alone
+                    return
+            action()
+
+        thread = threading.Thread(target=wait, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
     def test_open_ports(self):
         # test validation of run jobs
         ncores = 5
@@ -32,11 +72,11 @@ class TestPorts(unittest.TestCase):
                           progressbar=False)
         jobs = np.arange(0, ncores, 1)
 
-        # record opened ports after 1 second, then stop all sims
+        # record opened ports once all sims are running, then stop all sims
         open_ports = []
-        threading.Timer(1, 
+        self.when_running(rebp, ncores, 
                 lambda: [open_ports.append(rebp.current_open_ports()), 
-                         rebp.end_all(batch_buffer=10)]).start()
+                         rebp.end_all(batch_buffer=10)])
 
         # run all jobs
         rebp.run(jobs=jobs)
@@ -45,16 +85,33 @@ class TestPorts(unittest.TestCase):
         open_ports = open_ports[0]
         self.assertEqual(len(open_ports), ncores)
 
+    def test_open_ports_cache(self):
+        rebp = ReboundParallel(simfunc = setup_sim, cores=1, 
+                          port_buffer=1, port0=6800,
+                          progressbar=False)
+        rebp.ports_array = [6801, 6802]
+
+        # open a server on one of the ports
+        server = socket.socket()
+        server.bind(("localhost", 6801))
+        server.listen()
+        self.assertEqual(rebp.current_open_ports(), [6801])
+        server.close()
+
+        # check that recently found ports are only reused if max_age is set
+        self.assertEqual(rebp.current_open_ports(max_age=10), [6801])
+        self.assertEqual(rebp.current_open_ports(), [])
+
     def test_fetch_sim(self):
         rebp = ReboundParallel(simfunc = setup_sim, cores=1, 
                           port_buffer=1, port0=6200,
                           progressbar=False)
         jobs = np.arange(0, 1, 1)
 
-        # fetch sim after 1 second, then stop all sims
+        # fetch sim once the sim is running, then stop all sims
         sim = []
-        threading.Timer(1, lambda: [sim.append(rebp.fetch_sim(6201)),
-                                    rebp.end_all(batch_buffer=10)]).start()
+        self.when_running(rebp, 1, lambda: [sim.append(rebp.fetch_sim(6201)),
+                                            rebp.end_all(batch_buffer=10)])
 
         # run all jobs
         rebp.run(jobs=jobs)
@@ -71,11 +128,11 @@ class TestPorts(unittest.TestCase):
                           progressbar=False)
         jobs = np.arange(0, 1, 1)
 
-        # pause simulation after 1 second, fetch sim, then stop all sims
+        # pause simulation once the sim is running, fetch sim, then stop all sims
         sim = []
-        threading.Timer(1, lambda: [rebp.pause_sim(6301), 
-                                    sim.append(rebp.fetch_sim(6301)),
-                                    rebp.end_all(batch_buffer=10)]).start()
+        self.when_running(rebp, 1, lambda: [rebp.pause_sim(6301), 
+                                            sim.append(rebp.fetch_sim(6301)),
+                                            rebp.end_all(batch_buffer=10)])
 
         # run all jobs
         rebp.run(jobs=jobs)
@@ -83,17 +140,50 @@ class TestPorts(unittest.TestCase):
         # check that sim was paused
         self.assertEqual(sim[0]._status, -3)
 
+    def test_port_state(self):
+        rebp = ReboundParallel(simfunc = setup_sim, cores=1, 
+                          port_buffer=1, port0=6320,
+                          progressbar=False)
+        jobs = np.arange(0, 1, 1)
+
+        # pause then start simulation once the sim is running, record the states tracked
+        # locally and the statuses of the sim on the server, then stop all sims
+        states, statuses = [], []
+        def record():
+            states.append(rebp.sim_state(6321))
+            statuses.append(rebp.fetch_sim(6321)._status)
+
+        # a state left over by a previous sim that finished on this port is not trusted
+        def finished_before():
+            rebp.port_state[6321] = "finished"
+            states.append(rebp.sim_state(6321))
+
+        self.when_running(rebp, 1, lambda: [finished_before(),
+                                            record(),
+                                            rebp.pause_sim(6321),
+                                            record(),
+                                            rebp.start_sim(6321),
+                                            record(),
+                                            rebp.end_all(batch_buffer=10)])
+
+        # run all jobs
+        rebp.run(jobs=jobs)
+
+        # check that state was tracked locally and matches the server
+        self.assertEqual(states, ["running", "running", "paused", "running"])
+        self.assertEqual(statuses, [-1, -3, -1])
+
     def test_send_space(self):
         rebp = ReboundParallel(simfunc = setup_sim, cores=1, 
                           port_buffer=1, port0=6310,
                           progressbar=False)
         jobs = np.arange(0, 1, 1)
 
-        # pause simulation after 1 second, fetch sim, then stop all sims
+        # pause simulation once the sim is running, fetch sim, then stop all sims
         sim = []
-        threading.Timer(1, lambda: [rebp.send_space(6311), 
-                                    sim.append(rebp.fetch_sim(6311)),
-                                    rebp.end_all(batch_buffer=10)]).start()
+        self.when_running(rebp, 1, lambda: [rebp.send_space(6311), 
+                                            sim.append(rebp.fetch_sim(6311)),
+                                            rebp.end_all(batch_buffer=10)])
 
         # run all jobs
         rebp.run(jobs=jobs)
@@ -107,12 +197,12 @@ class TestPorts(unittest.TestCase):
                           progressbar=False)
         jobs = np.arange(0, 2, 1)
 
-        # pause all sims after 1 second, fetch sim, then stop all sims
+        # pause all sims once the sims are running, fetch sim, then stop all sims
         sim = []
-        threading.Timer(1, lambda: [rebp.pause_all(), 
-                                    sim.append(rebp.fetch_sim(6401)),
-                                    sim.append(rebp.fetch_sim(6402)),
-                                    rebp.end_all(batch_buffer=10)]).start()
+        self.when_running(rebp, 2, lambda: [rebp.pause_all(), 
+                                            sim.append(rebp.fetch_sim(6401)),
+                                            sim.append(rebp.fetch_sim(6402)),
+                                            rebp.end_all(batch_buffer=10)])
 
         # run all jobs
         rebp.run(jobs=jobs)
@@ -127,12 +217,12 @@ class TestPorts(unittest.TestCase):
                           progressbar=False)
         jobs = np.arange(0, 1, 1)
 
-        # pause simulation after 1 second, start sim again, fetch sim, then stop all sims
+        # pause simulation once the sim is running, start sim again, fetch sim, then stop all sims
         sim = []
-        threading.Timer(1, lambda: [rebp.pause_sim(6501), 
-                                    rebp.start_sim(6501), 
-                                    sim.append(rebp.fetch_sim(6501)),
-                                    rebp.end_all(batch_buffer=10)]).start()
+        self.when_running(rebp, 1, lambda: [rebp.pause_sim(6501), 
+                                            rebp.start_sim(6501), 
+                                            sim.append(rebp.fetch_sim(6501)),
+                                            rebp.end_all(batch_buffer=10)])
 
         # run all jobs
         rebp.run(jobs=jobs)
@@ -146,13 +236,13 @@ class TestPorts(unittest.TestCase):
                           progressbar=False)
         jobs = np.arange(0, 2, 1)
 
-        # pause all sims after 1 second, start sims again, fetch sim, then stop all sims
+        # pause all sims once the sims are running, start sims again, fetch sim, then stop all sims
         sim = []
-        threading.Timer(1, lambda: [rebp.pause_all(), 
-                                    rebp.start_all(), 
-                                    sim.append(rebp.fetch_sim(6601)),
-                                    sim.append(rebp.fetch_sim(6602)),
-                                    rebp.end_all(batch_buffer=10)]).start()
+        self.when_running(rebp, 2, lambda: [rebp.pause_all(), 
+                                            rebp.start_all(), 
+                                            sim.append(rebp.fetch_sim(6601)),
+                                            sim.append(rebp.fetch_sim(6602)),
+                                            rebp.end_all(batch_buffer=10)])
 
         # run all jobs
         rebp.run(jobs=jobs)
@@ -167,8 +257,8 @@ class TestPorts(unittest.TestCase):
                           progressbar=False)
         jobs = np.arange(0, 1, 1)
 
-        # stop sim after 0.5 second
-        threading.Timer(0.5, lambda: [rebp.end_sim(6701)]).start()
+        # stop sim once the sim is running
+        self.when_running(rebp, 1, lambda: [rebp.end_sim(6701)])
 
         # run all jobs
         result = rebp.run(jobs=jobs)
@@ -183,8 +273,8 @@ class TestPorts(unittest.TestCase):
                           progressbar=False)
         jobs = np.arange(0, 1, 1)
 
-        # stop sim after 0.5 second
-        threading.Timer(0.5, lambda: [rebp.send_q(6711)]).start()
+        # stop sim once the sim is running
+        self.when_running(rebp, 1, lambda: [rebp.send_q(6711)])
 
         # run all jobs
         result = rebp.run(jobs=jobs)
@@ -194,13 +284,14 @@ class TestPorts(unittest.TestCase):
         self.assertTrue(sim.t < MAXT)
 
     def test_end_current(self):
-        rebp = ReboundParallel(simfunc = setup_sim, cores=2, 
+        rebp = ReboundParallel(simfunc = setup_sim_until, cores=2, 
                           port_buffer=2,
                           progressbar=False)
-        jobs = np.arange(0, 4, 1)
+        # only the first 2 sims are interrupted, the others can be short
+        jobs = np.array([MAXT, MAXT, SHORT_MAXT, SHORT_MAXT])
 
-        # stop all current sims (only 2) after 0.5 second
-        threading.Timer(0.5, lambda: [rebp.end_all_current_sims()]).start()
+        # stop all current sims (only 2) once they are running
+        self.when_running(rebp, 2, lambda: [rebp.end_all_current_sims()])
 
         # run all jobs
         result = rebp.run(jobs=jobs)
@@ -215,17 +306,19 @@ class TestPorts(unittest.TestCase):
         # check that other sims ended normally
         sim3 = result[2][0]
         sim4 = result[3][0]
-        self.assertTrue(sim3.t == MAXT)
-        self.assertTrue(sim4.t == MAXT)
+        self.assertTrue(sim3.t == SHORT_MAXT)
+        self.assertTrue(sim4.t == SHORT_MAXT)
 
     def test_end_all(self):
+        # one port per job: a port reused right after its sim ended may not be free yet
         rebp = ReboundParallel(simfunc = setup_sim, cores=2, 
-                          port_buffer=2,
+                          port_buffer=5,
                           progressbar=False)
         jobs = np.arange(0, 10, 1)
 
-        # stop all sims after 0.5 second
-        threading.Timer(0.5, lambda: [rebp.end_all(batch_buffer=10)]).start()
+        # stop all sims once the sims are running, end_all returns as soon as the run finishes
+        # so a large batch_buffer only matters when workers are slow to start the next jobs
+        self.when_running(rebp, 2, lambda: [rebp.end_all(batch_buffer=100)])
 
         # run all jobs
         results = rebp.run(jobs=jobs)
@@ -235,6 +328,22 @@ class TestPorts(unittest.TestCase):
             sim = results[i][0]
             self.assertTrue(sim.t < MAXT)
 
+    def test_end_all_unfinished(self):
+        rebp = ReboundParallel(simfunc = setup_sim, cores=1, 
+                          port_buffer=1, port0=6720,
+                          progressbar=False)
+
+        # check that end_all warns if run is still going after the last attempt
+        rebp.run_finished.clear()
+        with self.assertWarns(RuntimeWarning):
+            rebp.end_all(sleep_timer=0.01, batch_buffer=2)
+
+        # check that end_all returns without warning once run has finished
+        rebp.run_finished.set()
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", RuntimeWarning)
+            rebp.end_all(sleep_timer=0.01, batch_buffer=2)
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -11,6 +11,9 @@ class TestUtils(unittest.TestCase):
         a = [[1,2], [2,3]]
         self.assertEqual(utils.dim(a), [2,2])
         self.assertEqual(len(utils.dim(a)), 2)
+
+        self.assertEqual(utils.dim([]), [0])
+        self.assertEqual(utils.dim(np.zeros((3, 2))), [3, 2])
     
     def test_islist(self):
         a = [1,2]
@@ -19,6 +22,9 @@ class TestUtils(unittest.TestCase):
         a = np.asarray([1,2,3])
         self.assertTrue(utils.is_list(a))
 
+        a = np.asarray(1)
+        self.assertTrue(not utils.is_list(a))
+
         a = "Not a list"
         self.assertTrue(not utils.is_list(a))
 
@@ -43,10 +49,51 @@ class TestUtils(unittest.TestCase):
 
     def test_timeformat(self):
         self.assertEqual(utils.time_format(0.1),  "0.10s")
+        self.assertEqual(utils.time_format(59.5), "59.50s")
+        self.assertEqual(utils.time_format(60),   "01m00s")
         self.assertEqual(utils.time_format(61),   "01m01s")
         self.assertEqual(utils.time_format(3661), "01h01m01s")
         self.assertEqual(utils.time_format(3661), "01h01m01s")
         self.assertEqual(utils.time_format(3600*24 + 3661), "1days 01h01m01s")
 
+    def test_guided_chunks(self):
+        chunks = utils.guided_chunks(list(range(20)), 2)
+        self.assertEqual([len(c) for c in chunks], [5, 4, 3, 2, 2, 1, 1, 1, 1])
+        self.assertEqual(sum(chunks, []), list(range(20)))
+        self.assertEqual(utils.guided_chunks([], 2), [])
+
+    def test_fixed_chunks(self):
+        chunks = utils.fixed_chunks(list(range(10)), 4)
+        self.assertEqual([len(c) for c in chunks], [4, 4, 2])
+        self.assertEqual(sum(chunks, []), list(range(10)))
+        self.assertEqual(utils.fixed_chunks([], 4), [])
+
+    def test_auto_chunk_size(self):
+        self.assertEqual(utils.auto_chunk_size(200, 5), 10)
+        self.assertEqual(utils.auto_chunk_size(3, 5), 1)
+
+    def test_to_columns(self):
+        rows = [(i, 0.1*i, [i, i, i], "sim") for i in range(4)]
+        ids, eccs, xyzs, sims = utils.to_columns(rows)
+        self.assertEqual(ids.tolist(), [0, 1, 2, 3])
+        self.assertTrue(np.allclose(eccs, 0.1*np.arange(4)))
+        self.assertEqual(xyzs.shape, (4, 3))
+        self.assertEqual(sims.dtype, object)
+
+        # results that are not tuples make a single column
+        self.assertEqual(utils.to_columns([1, 2])[0].tolist(), [1, 2])
+
+    def test_profile_batch_size(self):
+        self.assertEqual(utils.profile_batch_size(1., 1000, 5), 1)
+        self.assertEqual(utils.profile_batch_size(0.01, 1000, 5), 50)
+        self.assertEqual(utils.profile_batch_size(0.001, 100, 5), 5)
+        self.assertEqual(utils.profile_batch_size(0., 10, 5), 1)
+
+    def test_cost_by_eccentricity(self):
+        self.assertAlmostEqual(utils.cost_by_eccentricity([0.]), 1.)
+        self.assertGreater(utils.cost_by_eccentricity([0.9]), 
+                           utils.cost_by_eccentricity([0.1]))
+        self.assertTrue(np.isfinite(utils.cost_by_eccentricity([1.])))
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file